@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+""" End-to-end latency benchmarks of socos commands against an emulated
+Sonos speaker """
+
+from __future__ import print_function, division
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    # pylint: disable=import-error
+    from StringIO import StringIO
+except ImportError:
+    # StringIO has been moved to io in Python 3
+    from io import StringIO
+
+from emulator import add_emulator_arguments, emulator_from_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (name, arguments) of the benchmarked commands, in the order they are run.
+# IP is replaced by the address of the emulator. ml_index comes first, since
+# the other music library commands need the index.
+BENCHMARKS = [
+    ('ml_index', ['ml_index', 'IP']),
+    ('ml_tracks search', ['ml_tracks', 'artist=Artist 1']),
+    ('ml_tracks add', ['ml_tracks', 'IP', 'Track 1', 'add', '1']),
+    ('ml_albums replace', ['ml_albums', 'IP', 'Album 1', 'replace', '1']),
+    ('ml_browse', ['ml_browse', '2', '1']),
+    ('play', ['play', 'IP']),
+    ('play number', ['play', 'IP', '3']),
+    ('queue', ['queue', 'IP']),
+    ('volume', ['volume', 'IP']),
+    ('volume +1', ['volume', 'IP', '+1']),
+    ('state', ['state', 'IP']),
+]
+
+
+def percentile(values, fraction):
+    """Return the percentile of the values, with linear interpolation"""
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def run_in_process(args):
+    """Run a socos command in this process, without printing its output
+
+    Returns None if the command succeeded, otherwise the error message
+    """
+    import socos
+    # Start every run with a cold search cache, like a new socos process
+    socos.MUSIC_LIB.cached_searches.clear()
+    stdout, stderr = sys.stdout, sys.stderr
+    errors = StringIO()
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout, sys.stderr = devnull, errors
+        # pylint: disable=broad-except
+        try:
+            succeeded = socos.process_cmd(list(args))
+        except Exception as exception:
+            errors.write(repr(exception))
+            succeeded = False
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    if succeeded:
+        return None
+    return errors.getvalue().strip() or 'Unknown error'
+
+
+def run_in_subprocess(args):
+    """Run a socos command as a new process, like from the command line
+
+    Returns None if the command succeeded, otherwise the error message. socos
+    exits with status 0 after printing an error, so anything written to
+    stderr counts as an error.
+    """
+    command = [sys.executable, os.path.join(ROOT, 'bin', 'socos')] + args
+    pythonpath = [ROOT]
+    if os.environ.get('PYTHONPATH'):
+        pythonpath.append(os.environ['PYTHONPATH'])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(pythonpath))
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(command, stdout=devnull,
+                                   stderr=subprocess.PIPE, env=env)
+        _, errors = process.communicate()
+    errors = errors.decode('utf-8', 'replace').strip()
+    if process.returncode == 0 and not errors:
+        return None
+    return errors or 'Exit status {}'.format(process.returncode)
+
+
+def benchmark(emulator, run, name, args, repeat):
+    """Run a command repeatedly and return the results for the report
+
+    If a run fails, the command is not run again and the result only holds
+    the error
+    """
+    args = [emulator.host if arg == 'IP' else arg for arg in args]
+    durations = []
+    round_trips = []
+    for _ in range(repeat):
+        emulator.reset_counts()
+        start = time.time()
+        error = run(args)
+        if error is not None:
+            # Only the last line, which for a traceback is the exception
+            return {'name': name, 'error': error.splitlines()[-1],
+                    'actions': emulator.request_counts}
+        durations.append((time.time() - start) * 1000)
+        round_trips.append(sum(emulator.request_counts.values()))
+    return {
+        'name': name,
+        'runs': repeat,
+        'round_trips': sum(round_trips) / repeat,
+        'min': min(durations),
+        'median': percentile(durations, 0.5),
+        'p90': percentile(durations, 0.9),
+        'max': max(durations),
+        # The requests of the last run by action, e.g. AVTransport.Play
+        'actions': emulator.request_counts,
+    }
+
+
+def print_report(results, verbose):
+    """Print the results as a table"""
+    header = '{: <20} {: >5} {: >12} {: >10} {: >10} {: >10} {: >10}'
+    row = '{name: <20} {runs: >5} {round_trips: >12.1f} {min: >10.1f} '\
+          '{median: >10.1f} {p90: >10.1f} {max: >10.1f}'
+    print(header.format('command', 'runs', 'round trips', 'min ms',
+                        'median ms', 'p90 ms', 'max ms'))
+    for result in results:
+        if 'error' in result:
+            print('{: <20} ERROR: {}'.format(result['name'], result['error']))
+        else:
+            print(row.format(**result))
+        if verbose:
+            for action, count in sorted(result['actions'].items()):
+                print('    {: <45} {: >6}'.format(action, count))
+
+
+def main():
+    """ Run the benchmarks and print the report """
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_emulator_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of runs of each command '
+                        '(default: %(default)s)')
+    parser.add_argument('--index-repeat', type=int, default=2,
+                        help='number of runs of ml_index '
+                        '(default: %(default)s)')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='run every command as a new socos process, '
+                        'which includes the start up time')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the requests of each command by action')
+    parser.add_argument('commands', nargs='*', metavar='command',
+                        help='names of the commands to benchmark (default: '
+                        'all)')
+    args = parser.parse_args()
+
+    # Keep the music library database of the benchmarks apart from the
+    # user's own
+    home = tempfile.mkdtemp(prefix='socos-benchmark-')
+    os.environ['HOME'] = home
+
+    emulator = emulator_from_arguments(args)
+    emulator.start()
+    run = run_in_subprocess if args.subprocess else run_in_process
+    results = []
+    try:
+        for name, command in BENCHMARKS:
+            if args.commands and name not in args.commands:
+                continue
+            repeat = args.index_repeat if name == 'ml_index' else args.repeat
+            results.append(benchmark(emulator, run, name, command, repeat))
+    finally:
+        emulator.stop()
+        shutil.rmtree(home)
+
+    print_report(results, args.verbose)
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+
+""" An emulated Sonos speaker on localhost for benchmarking socos """
+
+from __future__ import print_function, division
+
+import argparse
+import random
+import sys
+import threading
+import time
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as XML
+
+try:
+    # pylint: disable=import-error
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    # The modules have been renamed in Python 3
+    # pylint: disable=import-error
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+UID = 'RINCON_000E58EMULATOR01400'
+
+DIDL_TEMPLATE = \
+    '<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" '\
+    'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" '\
+    'xmlns:r="urn:schemas-rinconnetworks-com:metadata-1-0/" '\
+    'xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">{}</DIDL-Lite>'
+
+TRACK_TEMPLATE = \
+    '<item id="{item_id}" parentID="{parent_id}" restricted="true">'\
+    '<res protocolInfo="x-file-cifs:*:audio/mpeg:*" duration="0:03:30">'\
+    '{uri}</res><upnp:albumArtURI>/getaa?u={uri}</upnp:albumArtURI>'\
+    '<dc:title>{title}</dc:title>'\
+    '<upnp:class>object.item.audioItem.musicTrack</upnp:class>'\
+    '<dc:creator>{creator}</dc:creator><upnp:album>{album}</upnp:album>'\
+    '<upnp:originalTrackNumber>{number}</upnp:originalTrackNumber></item>'
+
+CONTAINER_TEMPLATE = \
+    '<container id="{item_id}" parentID="{parent_id}" restricted="true">'\
+    '<dc:title>{title}</dc:title><upnp:class>{item_class}</upnp:class>'\
+    '{extra}<res protocolInfo="x-rincon-playlist:*:*:*">{uri}</res>'\
+    '</container>'
+
+ENVELOPE_TEMPLATE = \
+    '<?xml version="1.0"?>'\
+    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '\
+    's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'\
+    '<s:Body>{}</s:Body></s:Envelope>'
+
+RESPONSE_TEMPLATE = \
+    '<u:{action}Response '\
+    'xmlns:u="urn:schemas-upnp-org:service:{service}:1">'\
+    '{arguments}</u:{action}Response>'
+
+FAULT_TEMPLATE = \
+    '<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError'\
+    '</faultstring><detail><UPnPError '\
+    'xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>{}</errorCode>'\
+    '</UPnPError></detail></s:Fault>'
+
+ZP_STATUS_TEMPLATE = \
+    '<?xml version="1.0" ?><ZPSupportInfo><ZPInfo>'\
+    '<ZoneName>Emulator</ZoneName><ZoneIcon>x-rincon-roomicon:living'\
+    '</ZoneIcon><LocalUID>{}</LocalUID><SerialNumber>00-0E-58-EM-UL-AT:0'\
+    '</SerialNumber><SoftwareVersion>26.1-76230</SoftwareVersion>'\
+    '<HardwareVersion>1.8.1.2-1</HardwareVersion>'\
+    '<MACAddress>00:0E:58:EM:UL:AT</MACAddress></ZPInfo></ZPSupportInfo>'
+
+ZONE_GROUP_STATE_TEMPLATE = \
+    '<ZoneGroups><ZoneGroup Coordinator="{uid}" ID="{uid}:1">'\
+    '<ZoneGroupMember UUID="{uid}" '\
+    'Location="http://{host}:{port}/xml/device_description.xml" '\
+    'ZoneName="Emulator" Icon="x-rincon-roomicon:living" '\
+    'Configuration="1" SoftwareVersion="26.1-76230" '\
+    'MinCompatibleVersion="25.0-00000" BootSeq="1"/>'\
+    '</ZoneGroup></ZoneGroups>'
+
+CONTROL_URLS = {
+    '/MediaRenderer/AVTransport/Control': 'AVTransport',
+    '/MediaRenderer/RenderingControl/Control': 'RenderingControl',
+    '/MediaServer/ContentDirectory/Control': 'ContentDirectory',
+    '/ZoneGroupTopology/Control': 'ZoneGroupTopology',
+}
+
+
+class Library(object):
+    """A generated music library
+
+    The library has 'tracks' tracks, grouped 'tracks_per_album' to an album
+    and 'albums_per_artist' albums to an artist, and 'playlists' playlists.
+    All items are kept as ready made DIDL-Lite snippets, indexed by the
+    object ids that are browsed, e.g. 'A:TRACKS'.
+    """
+
+    def __init__(self, tracks=1000, tracks_per_album=10, albums_per_artist=5,
+                 playlists=10):
+        self.tracks = []
+        self.browse = {'A:TRACKS': [], 'A:ALBUM': [], 'A:ARTIST': [],
+                       'A:PLAYLISTS': []}
+        # Tracks that are added to the queue for an enqueued URI
+        self.tracks_for_uri = {}
+
+        albums = max(1, tracks // tracks_per_album)
+        for number in range(tracks):
+            album = number % albums
+            artist = album // albums_per_artist
+            track = {
+                'uri': 'x-file-cifs://emulator/Music/artist{}/album{}/'
+                       'track{}.mp3'.format(artist, album, number),
+                'title': 'Track {}'.format(number),
+                'creator': 'Artist {}'.format(artist),
+                'album': 'Album {}'.format(album),
+                'number': number // albums + 1,
+            }
+            track['item_id'] = track['uri'].replace('x-file-cifs', 'S')
+            self.tracks.append(track)
+            self.tracks_for_uri[track['uri']] = [track]
+            self.browse['A:TRACKS'].append(TRACK_TEMPLATE.format(
+                parent_id='A:TRACKS', **escape_all(track)))
+
+        for album in range(albums):
+            artist = album // albums_per_artist
+            uri = 'x-rincon-playlist:{}#A:ALBUM/Album {}'.format(UID, album)
+            self.tracks_for_uri[uri] = [track for track in self.tracks if
+                                        track['album'] == 'Album {}'.format(
+                                            album)]
+            extra = '<dc:creator>{}</dc:creator>'.format(
+                escape('Artist {}'.format(artist)))
+            self.browse['A:ALBUM'].append(self._container(
+                'A:ALBUM', 'Album {}'.format(album),
+                'object.container.album.musicAlbum', uri, extra))
+
+        artists = (albums + albums_per_artist - 1) // albums_per_artist
+        for artist in range(artists):
+            uri = 'x-rincon-playlist:{}#A:ARTIST/Artist {}'.format(UID, artist)
+            self.tracks_for_uri[uri] = [track for track in self.tracks if
+                                        track['creator'] == 'Artist {}'.format(
+                                            artist)]
+            self.browse['A:ARTIST'].append(self._container(
+                'A:ARTIST', 'Artist {}'.format(artist),
+                'object.container.person.musicArtist', uri))
+
+        for playlist in range(playlists):
+            uri = 'x-file-cifs://emulator/Music/playlist{}.m3u'.format(
+                playlist)
+            self.tracks_for_uri[uri] = self.tracks[playlist::playlists][:20]
+            self.browse['A:PLAYLISTS'].append(self._container(
+                'A:PLAYLISTS', 'Playlist {}'.format(playlist),
+                'object.container.playlistContainer', uri))
+
+    @staticmethod
+    def _container(parent_id, title, item_class, uri, extra=''):
+        """Return the DIDL-Lite snippet for a container"""
+        item_id = uri.split('#')[-1] if '#' in uri else \
+            uri.replace('x-file-cifs', 'S')
+        return CONTAINER_TEMPLATE.format(
+            item_id=escape(item_id), parent_id=parent_id, title=escape(title),
+            item_class=item_class, extra=extra, uri=escape(uri))
+
+
+def escape_all(values):
+    """Return a copy of the dict with all string values XML escaped"""
+    return dict((key, escape(value) if hasattr(value, 'lower') else value)
+                for key, value in values.items())
+
+
+class SonosEmulator(object):
+    """An emulated Sonos speaker, that serves the AVTransport,
+    RenderingControl, ContentDirectory and ZoneGroupTopology SOAP services
+    over HTTP
+
+    SoCo always talks to port 1400, so the emulator is reached with
+    soco.SoCo(host). Every request is delayed by 'latency' seconds plus a
+    uniformly distributed random 'jitter' in either direction, and at most
+    'page_size' items are returned per browse, like a real device. The
+    number of requests per action is counted, see request_counts.
+    """
+
+    def __init__(self, host='127.0.0.1', port=1400, tracks=1000, queue=20,
+                 latency=0.0, jitter=0.0, page_size=100, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.library = Library(tracks)
+        self.random = random.Random(seed)
+
+        # Speaker state
+        self.queue = list(self.library.tracks[:queue])
+        self.position = 1 if self.queue else 0
+        self.transport_state = 'STOPPED'
+        self.volume = 20
+        self.mute = 0
+        self.update_id = 1
+
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start serving requests in a background thread"""
+        self._server = EmulatorServer((self.host, self.port), EmulatorHandler)
+        self._server.emulator = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def request_counts(self):
+        """A dict of the number of requests per 'Service.Action'"""
+        with self._lock:
+            return dict(self._counts)
+
+    def reset_counts(self):
+        """Reset the request counts"""
+        with self._lock:
+            self._counts.clear()
+
+    def delay(self, name):
+        """Count a request and sleep for the emulated network latency"""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            jitter = self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency + jitter))
+
+    def call(self, service, action, arguments):
+        """Perform an action and return a list of (name, value) tuples
+
+        Raises KeyError for unknown actions
+        """
+        method = getattr(self, '_{}_{}'.format(service, action), None)
+        if method is None:
+            raise KeyError(action)
+        with self._lock:
+            return method(arguments) or []
+
+    # AVTransport
+    def _AVTransport_GetTransportInfo(self, _):
+        return [('CurrentTransportState', self.transport_state),
+                ('CurrentTransportStatus', 'OK'), ('CurrentSpeed', '1')]
+
+    def _AVTransport_GetPositionInfo(self, _):
+        if not self.queue:
+            return [('Track', 0), ('TrackDuration', '0:00:00'),
+                    ('TrackMetaData', ''), ('TrackURI', ''),
+                    ('RelTime', '0:00:00'), ('AbsTime', 'NOT_IMPLEMENTED'),
+                    ('RelCount', 2147483647), ('AbsCount', 2147483647)]
+        track = self.queue[self.position - 1]
+        metadata = DIDL_TEMPLATE.format(TRACK_TEMPLATE.format(
+            parent_id='Q:0', **escape_all(track)))
+        return [('Track', self.position), ('TrackDuration', '0:03:30'),
+                ('TrackMetaData', metadata), ('TrackURI', track['uri']),
+                ('RelTime', '0:00:00'), ('AbsTime', 'NOT_IMPLEMENTED'),
+                ('RelCount', 2147483647), ('AbsCount', 2147483647)]
+
+    def _AVTransport_Play(self, _):
+        self.transport_state = 'PLAYING'
+
+    def _AVTransport_Pause(self, _):
+        self.transport_state = 'PAUSED_PLAYBACK'
+
+    def _AVTransport_Stop(self, _):
+        self.transport_state = 'STOPPED'
+
+    def _AVTransport_Next(self, _):
+        self.position = min(self.position + 1, len(self.queue))
+
+    def _AVTransport_Previous(self, _):
+        self.position = max(self.position - 1, min(1, len(self.queue)))
+
+    def _AVTransport_Seek(self, arguments):
+        if arguments.get('Unit') == 'TRACK_NR':
+            self.position = int(arguments['Target'])
+
+    def _AVTransport_SetAVTransportURI(self, _):
+        pass
+
+    def _AVTransport_RemoveAllTracksFromQueue(self, _):
+        self.queue = []
+        self.position = 0
+        self.update_id += 1
+
+    def _AVTransport_AddURIToQueue(self, arguments):
+        tracks = self.library.tracks_for_uri.get(arguments['EnqueuedURI'], [])
+        first = len(self.queue) + 1
+        self.queue.extend(tracks)
+        if self.queue and not self.position:
+            self.position = 1
+        self.update_id += 1
+        return [('FirstTrackNumberEnqueued', first),
+                ('NumTracksAdded', len(tracks)),
+                ('NewQueueLength', len(self.queue))]
+
+    # RenderingControl
+    def _RenderingControl_GetVolume(self, _):
+        return [('CurrentVolume', self.volume)]
+
+    def _RenderingControl_SetVolume(self, arguments):
+        self.volume = int(arguments['DesiredVolume'])
+
+    def _RenderingControl_GetMute(self, _):
+        return [('CurrentMute', self.mute)]
+
+    def _RenderingControl_SetMute(self, arguments):
+        self.mute = int(arguments['DesiredMute'])
+
+    # ZoneGroupTopology, used by newer SoCo versions to get the speaker uid
+    def _ZoneGroupTopology_GetZoneGroupState(self, _):
+        return [('ZoneGroupState', ZONE_GROUP_STATE_TEMPLATE.format(
+            uid=UID, host=self.host, port=self.port))]
+
+    # ContentDirectory
+    def _ContentDirectory_Browse(self, arguments):
+        object_id = arguments['ObjectID']
+        if object_id == 'Q:0':
+            items = [TRACK_TEMPLATE.format(parent_id='Q:0',
+                                           **escape_all(track))
+                     for track in self.queue]
+        elif object_id in self.library.browse:
+            items = self.library.browse[object_id]
+        else:
+            raise KeyError(object_id)
+        start = int(arguments.get('StartingIndex', 0))
+        count = min(int(arguments.get('RequestedCount', 100)),
+                    self.page_size)
+        page = items[start:start + count]
+        return [('Result', DIDL_TEMPLATE.format(''.join(page))),
+                ('NumberReturned', len(page)), ('TotalMatches', len(items)),
+                ('UpdateID', self.update_id)]
+
+
+class EmulatorServer(ThreadingMixIn, HTTPServer):
+    """HTTP server that handles every request in its own thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+    emulator = None
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    """Handles the SOAP requests and the status page for the emulator"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the zone player status, used to get the speaker uid"""
+        self.server.emulator.delay('GET ' + self.path)
+        if self.path == '/status/zp':
+            self._respond(200, ZP_STATUS_TEMPLATE.format(UID))
+        else:
+            self._respond(404, '')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Perform a SOAP action"""
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        service = CONTROL_URLS.get(self.path)
+        if service is None:
+            self.server.emulator.delay('POST ' + self.path)
+            self._respond(404, '')
+            return
+        action = self.headers.get('SOAPACTION', '').strip('"').split('#')[-1]
+        self.server.emulator.delay('{}.{}'.format(service, action))
+
+        # The arguments are the children of the first element in the body
+        tree = XML.fromstring(body)
+        body_element = tree.find(
+            '{http://schemas.xmlsoap.org/soap/envelope/}Body')
+        arguments = dict((element.tag, element.text or '')
+                         for element in body_element[0])
+
+        try:
+            result = self.server.emulator.call(service, action, arguments)
+        except KeyError:
+            # 401 is the UPnP error code for 'Invalid Action'
+            self._respond(500, ENVELOPE_TEMPLATE.format(
+                FAULT_TEMPLATE.format(401)))
+            return
+        arguments = ''.join('<{0}>{1}</{0}>'.format(name, escape(str(value)))
+                            for name, value in result)
+        self._respond(200, ENVELOPE_TEMPLATE.format(RESPONSE_TEMPLATE.format(
+            action=action, service=service, arguments=arguments)))
+
+    def _respond(self, status, text):
+        """Send a response with an XML body"""
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Do not log every request to stderr"""
+        pass
+
+
+def add_emulator_arguments(parser):
+    """Add the command line arguments that configure an emulator"""
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to serve on (default: %(default)s)')
+    parser.add_argument('--tracks', type=int, default=1000,
+                        help='number of tracks in the music library '
+                        '(default: %(default)s)')
+    parser.add_argument('--queue', type=int, default=20,
+                        help='number of tracks in the queue at start '
+                        '(default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay of each request in milliseconds '
+                        '(default: %(default)s)')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='maximum random change of the delay in '
+                        'milliseconds (default: %(default)s)')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='maximum number of items returned per browse '
+                        '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the jitter')
+
+
+def emulator_from_arguments(args):
+    """Create an emulator from parsed command line arguments"""
+    return SonosEmulator(host=args.host, tracks=args.tracks, queue=args.queue,
+                         latency=args.latency / 1000,
+                         jitter=args.jitter / 1000, page_size=args.page_size,
+                         seed=args.seed)
+
+
+def main():
+    """ Run an emulated speaker until interrupted """
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_emulator_arguments(parser)
+    emulator = emulator_from_arguments(parser.parse_args())
+    emulator.start()
+    print('Emulating a Sonos speaker at {}:{}. Use e.g.: socos play {}'
+          .format(emulator.host, emulator.port, emulator.host))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+    counts = emulator.request_counts
+    for name in sorted(counts):
+        print('{: <45} {: >6}'.format(name, counts[name]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
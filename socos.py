@@ -18,6 +18,8 @@ from collections import OrderedDict
 import sqlite3
 import json
 import shlex
+import threading
+import time
 
 try:
     # pylint: disable=import-error
@@ -39,104 +41,221 @@ except NameError:
     # raw_input has been renamed to input in Python 3
     pass
 
-import soco
-from soco.data_structures import MLTrack, MLAlbum, MLArtist, MLPlaylist
+# soco is imported where it is used, since importing it takes most of the
+# start up time and music library searches do not need it
 
 
 class MusicLibrary(object):
     """Class that implements the music library support for socos"""
 
     def __init__(self):
-        # Sqlite3 variables
-        self.connection = None
-        self.cursor = None
+        # Sqlite3 connections can only be used from the thread that opened
+        # them, so they are kept per thread, see _open_db
+        self._local = threading.local()
+        # Seconds to wait for a lock on the database before giving up
+        self.timeout = 5.0
         # As a simple opitmization we cache 10 searches
         self.cached_searches = OrderedDict()
         self.cache_length = 10
+        self._cache_lock = threading.Lock()
         # Date type and tables names
         self.data_types = ['playlists', 'artists', 'albums', 'tracks']
+        # Number of searches to keep in the search log, see _log_search
+        self.search_log_length = 1000
+        # The text columns of each table that can be searched
+        self.search_fields = {
+            'tracks': ['title', 'album', 'artist'],
+            'albums': ['title', 'artist'],
+            'artists': ['title'],
+            'playlists': ['title'],
+        }
+
+    @property
+    def connection(self):
+        """The connection last opened by _open_db in this thread"""
+        return getattr(self._local, 'connection', None)
+
+    @property
+    def cursor(self):
+        """The cursor last opened by _open_db in this thread"""
+        return getattr(self._local, 'cursor', None)
 
-    def _open_db(self):
+    @staticmethod
+    def _db_path(filename):
+        """Return the path of a database file in the socos config folder"""
+        userdir = os.path.expanduser('~')
+        return os.path.join(userdir, '.config', 'socos', filename)
+
+    def _open_db(self, read_only=True):
         """Open a connection to the sqlite3 database and if necessary create
         the the folders and path for it. The file will be saved to:
         USERPATH/.config/socos/musiclib.db where USERPATH is as returned by
         os.path.expanduser
+
+        Each thread has one read-only and one writable connection, which are
+        opened on first use. The one asked for becomes self.connection and
+        self.cursor for the calling thread. The writable connection puts the
+        database in WAL mode, so that readers in other threads and processes
+        are not blocked by, and do not block, an ongoing indexing.
         """
-        if not self.connection:
-            userdir = os.path.expanduser('~')
-            dbdir = os.path.join(userdir, '.config', 'socos')
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = {}
+        connection = self._local.connections.get(read_only)
+        if not connection:
+            dbpath = self._db_path('musiclib.db')
+            dbdir = os.path.dirname(dbpath)
             if not os.path.exists(dbdir):
                 os.makedirs(dbdir)
                 yield 'Created folder: \'{}\''.format(dbdir)
 
-            dbpath = os.path.join(dbdir, 'musiclib.db')
             if not os.path.exists(dbpath):
                 yield 'Created Sqlite3 database for music library '\
                       'information at: \'{}\''.format(dbpath)
-            self.connection = sqlite3.connect(dbpath)
-            self.cursor = self.connection.cursor()
+            # Transactions are handled explicitly, see index
+            connection = sqlite3.connect(dbpath, timeout=self.timeout,
+                                         isolation_level=None)
+            if read_only:
+                connection.execute('PRAGMA query_only = ON')
+            else:
+                connection.execute('PRAGMA journal_mode = WAL')
+            self._local.connections[read_only] = connection
+        self._local.connection = connection
+        self._local.cursor = connection.cursor()
+
+    def _is_indexed(self):
+        """Return whether all the music library tables exist, with the
+        artist, album and track links of the current layout
+        """
+        query = 'SELECT name FROM sqlite_master WHERE type = "table"'
+        self.cursor.execute(query)
+        tables = [row[0] for row in self.cursor.fetchall()]
+        if not all(data_type in tables for data_type in self.data_types):
+            return False
+        return 'album_id' in self._get_columns('tracks')
+
+    def _index_version(self):
+        """Return the version of the index, which is increased on every
+        indexing
+        """
+        self.cursor.execute('PRAGMA user_version')
+        return self.cursor.fetchone()[0]
+
+    def _begin_write(self):
+        """Begin the write transaction for indexing
+
+        SQLite allows only one writer at a time, so this also works as the
+        lock that keeps two threads or processes from indexing at the same
+        time. If the lock is taken, fail right away instead of waiting for
+        the other indexing to finish.
+        """
+        self.cursor.execute('PRAGMA busy_timeout = 0')
+        try:
+            self.cursor.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            message = 'The music library is already being indexed. Wait '\
+                      'for that to finish and try again'
+            raise TypeError(message)
+        finally:
+            self.cursor.execute('PRAGMA busy_timeout = {}'.format(
+                int(self.timeout * 1000)))
 
     def index(self, sonos):
-        """Update the index of the music library information"""
-        for string in self._open_db():
+        """Update the index of the music library information
+
+        The whole index is rebuilt in a single transaction, so searches keep
+        using the old index until the new one is complete.
+        """
+        for string in self._open_db(read_only=False):
             yield string
-        # Drop old tables
-        query = 'SELECT name FROM sqlite_master WHERE type = "table"'
-        self.cursor.execute(query)
-        number_of_tables = len(self.cursor.fetchall())
-        if number_of_tables == 4:
-            yield 'Deleting tables'
-            query = 'DROP TABLE {}'
-            for table_name in self.data_types:
+        self._begin_write()
+        start = time.time()
+        committed = False
+        try:
+            # Drop old tables
+            query = 'SELECT name FROM sqlite_master WHERE type = "table"'
+            self.cursor.execute(query)
+            if self.cursor.fetchall():
+                yield 'Deleting tables'
+            query = 'DROP TABLE IF EXISTS {}'
+            for table_name in self.data_types + ['index_stats']:
                 self.cursor.execute(query.format(table_name))
-        self.connection.commit()
-
-        # Form new tables
-        yield 'Creating tables'
-        create_statements = [
-            'CREATE TABLE tracks (title text, album text, artist text, '
-            'content text)',
-            'CREATE TABLE albums (title text, artist text, content text)',
-            'CREATE TABLE artists (title text, content text)',
-            'CREATE TABLE playlists (title text, content text)',
-        ]
-        for create in create_statements:
-            self.cursor.execute(create)
-        self.connection.commit()
 
-        # Index the 4 different types of data
-        for data_type in self.data_types:
-            for string in self._index_single_type(sonos, data_type):
-                yield string
+            # Form new tables. The content column must be the last one.
+            yield 'Creating tables'
+            create_statements = [
+                'CREATE TABLE tracks (id integer PRIMARY KEY, '
+                'album_id integer REFERENCES albums(id), '
+                'artist_id integer REFERENCES artists(id), '
+                'title text, album text, artist text, track_number integer, '
+                'content text)',
+                'CREATE TABLE albums (id integer PRIMARY KEY, '
+                'artist_id integer REFERENCES artists(id), '
+                'title text, artist text, content text)',
+                'CREATE TABLE artists (id integer PRIMARY KEY, title text, '
+                'content text)',
+                'CREATE TABLE playlists (id integer PRIMARY KEY, title text, '
+                'content text)',
+                'CREATE TABLE index_stats (data_type text, items integer, '
+                'pages integer, seconds real, indexed_at real)',
+            ]
+            for create in create_statements:
+                self.cursor.execute(create)
+
+            # Index the 4 different types of data
+            for data_type in self.data_types:
+                for string in self._index_single_type(sonos, data_type):
+                    yield string
+            yield 'Linking artists, albums and tracks'
+            self._link_index()
+
+            # Add the totals to the statistics, see stats
+            query = 'INSERT INTO index_stats SELECT "all", SUM(items), '\
+                    'SUM(pages), ?, ? FROM index_stats'
+            self.cursor.execute(query, [time.time() - start, time.time()])
+
+            # Bump the version, which makes all processes drop cached searches
+            self.cursor.execute('PRAGMA user_version = {}'.format(
+                self._index_version() + 1))
+            self.cursor.execute('COMMIT')
+            committed = True
+        finally:
+            # Leave the old index in place if indexing failed or was cancelled
+            if not committed:
+                self.cursor.execute('ROLLBACK')
 
     def _index_single_type(self, sonos, data_type):
         """Index a single type if data"""
-        fields = self._get_columns(data_type)
-        # Artist is called creator in the UPnP data structures
-        if 'artist' in fields:
-            fields[fields.index('artist')] = 'creator'
-
-        # E.g: INSERT INTO tracks VALUES (?,?,?,?)
-        query = 'INSERT INTO {} VALUES ({})'.format(
-            data_type, ','.join(['?'] * len(fields)))
+        columns = self.search_fields[data_type] + ['content']
+        if data_type == 'tracks':
+            columns.insert(-1, 'track_number')
+        # Some columns have other names in the UPnP data structures
+        upnp_names = {'artist': 'creator',
+                      'track_number': 'original_track_number'}
+        fields = [upnp_names.get(column, column) for column in columns]
+
+        # E.g: INSERT INTO albums (title, artist, content) VALUES (?,?,?)
+        query = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            data_type, ', '.join(columns), ','.join(['?'] * len(columns)))
 
         # For brevity
         get_ml_inf = sonos.get_music_library_information
 
+        start = time.time()
         total = get_ml_inf(data_type, 0, 1)['total_matches']
         yield 'Adding: {}'.format(data_type)
         count = 0
+        pages = 0
         while count < total:
             # Get as many matches as the device will give each time
             search = get_ml_inf(data_type, start=count, max_items=1000)
+            pages += 1
             for item in search['item_list']:
                 # In the database we save a set of text fields and the content
                 # dict as json. See self.index for details on fields.
-                values = [getattr(item, field) for field in
-                          fields[:-1]]
-                values.append(json.dumps(item.to_dict))
+                content = item.to_dict
+                values = [content.get(field) for field in fields[:-1]]
+                values.append(json.dumps(content))
                 self.cursor.execute(query, values)
-            self.connection.commit()
 
             # Print out status while running because indexing tracks can take a
             # while
@@ -145,6 +264,38 @@ class MusicLibrary(object):
                 .format(len(str(total)))\
                 .format(count * 100 / total, count, total)
 
+        query = 'INSERT INTO index_stats VALUES (?, ?, ?, ?, ?)'
+        self.cursor.execute(query, [data_type, count, pages,
+                                    time.time() - start, time.time()])
+
+    def _link_index(self):
+        """Fill in the artist and album references from the text columns
+
+        The device only gives the names of the artist and album of an item, so
+        the references are found by name. A track is linked to the album with
+        the same title by the same artist or, failing that, to the only album
+        with that title. Compilations like 'Greatest Hits' by 'Various
+        Artists' are therefore only linked if the title is unique.
+        """
+        statements = [
+            'CREATE INDEX artists_title ON artists (title)',
+            'CREATE INDEX albums_title_artist ON albums (title, artist)',
+            'UPDATE albums SET artist_id = (SELECT MIN(artists.id) '
+            'FROM artists WHERE artists.title = albums.artist)',
+            'UPDATE tracks SET artist_id = (SELECT MIN(artists.id) '
+            'FROM artists WHERE artists.title = tracks.artist), '
+            'album_id = COALESCE('
+            '(SELECT MIN(albums.id) FROM albums WHERE '
+            'albums.title = tracks.album AND albums.artist = tracks.artist), '
+            '(SELECT albums.id FROM albums WHERE albums.title = tracks.album '
+            'GROUP BY albums.title HAVING COUNT(*) = 1))',
+            'CREATE INDEX albums_artist_id ON albums (artist_id)',
+            'CREATE INDEX tracks_album_id ON tracks (album_id)',
+            'CREATE INDEX tracks_artist_id ON tracks (artist_id)',
+        ]
+        for statement in statements:
+            self.cursor.execute(statement)
+
     def _get_columns(self, table):
         """Return the names of the columns in the table"""
         query = 'PRAGMA table_info({})'.format(table)
@@ -226,13 +377,7 @@ class MusicLibrary(object):
         for string in self._open_db():
             yield string
 
-        # Check if the music library has been indexed
-        query = 'SELECT name FROM sqlite_master WHERE type = "table"'
-        self.cursor.execute(query)
-        if len(self.cursor.fetchall()) != 4:
-            message = 'Your music library cannot be search until it has been '\
-                      'indexed. First run \'ml_index\''
-            raise TypeError(message)
+        self._check_indexed()
         # Check if there is a search term
         if len(args) < 1:
             message = 'Search term missing. See \'help ml_{}\' for details'.\
@@ -240,7 +385,12 @@ class MusicLibrary(object):
             raise TypeError(message)
 
         # And finally perform the search
-        results = self._search(data_type, *args)
+        try:
+            results = self._search(data_type, *args)
+        except sqlite3.OperationalError as exception:
+            message = 'The music library could not be searched: {}'.format(
+                exception)
+            raise TypeError(message)
 
         # If there are no other arguments then the search
         if len(args) == 1:
@@ -248,15 +398,206 @@ class MusicLibrary(object):
                 yield string
         # Or if there are the right number for a play command
         elif len(args) == 3:
-            yield self._play(sonos, data_type, results, *args)
+            yield self._play(sonos, data_type, results, *args[1:])
         # Else give error
         else:
             message = 'Incorrect play syntax: See \'help ml_{}\' for details'.\
                 format(data_type)
             raise TypeError(message)
 
+    def _check_indexed(self):
+        """Raise an error if the music library has not been indexed"""
+        if not self._is_indexed():
+            message = 'Your music library cannot be search until it has been '\
+                      'indexed. First run \'ml_index\''
+            raise TypeError(message)
+
+    def browse(self, sonos, *args):
+        """Browse and possibly play artists, albums and tracks in the library
+
+        Usage: ml_browse [artist_number [album_number]] [action number]
+
+        Without numbers all artists are listed. With an artist number the
+        albums by that artist are listed and with an artist and an album
+        number the tracks on that album are listed. The numbers refer to the
+        item numbers in the previous listing. Action can be 'add' or 'replace'
+        and number refers to the item number in the listing. Browsing only
+        uses the index and never contacts the speaker.
+
+        Examples:
+        ml_browse
+        ml_browse 12
+        ml_browse 12 3
+        ml_browse 12 3 add 5
+        ml_browse 12 replace 3
+        """
+        for string in self._open_db():
+            yield string
+        self._check_indexed()
+
+        # Split the arguments in the browse path and the play arguments
+        path = list(args)
+        play_args = []
+        for action in ['add', 'replace']:
+            if action in path:
+                play_args = path[path.index(action):]
+                path = path[:path.index(action)]
+        if len(path) > 2 or len(play_args) not in [0, 2]:
+            message = 'Incorrect browse syntax: See \'help ml_browse\' for '\
+                      'details'
+            raise TypeError(message)
+
+        try:
+            data_type, results = self._browse(path)
+        except sqlite3.OperationalError as exception:
+            message = 'The music library could not be browsed: {}'.format(
+                exception)
+            raise TypeError(message)
+
+        if play_args:
+            yield self._play(sonos, data_type, results, *play_args)
+        else:
+            for string in self._print_results(data_type, results):
+                yield string
+
+    def _browse(self, path):
+        """Return the data type and the items at the browse path"""
+        # The id is the first column of all tables
+        query = 'SELECT * FROM artists ORDER BY title, id'
+        self.cursor.execute(query)
+        results = self.cursor.fetchall()
+        if not path:
+            return 'artists', results
+
+        artist_id = results[self._get_number(results, path[0], 'Artist')][0]
+        query = 'SELECT * FROM albums WHERE artist_id = ? OR id IN '\
+                '(SELECT album_id FROM tracks WHERE artist_id = ?) '\
+                'ORDER BY title, id'
+        self.cursor.execute(query, [artist_id, artist_id])
+        results = self.cursor.fetchall()
+        if len(path) == 1:
+            return 'albums', results
+
+        album_id = results[self._get_number(results, path[1], 'Album')][0]
+        query = 'SELECT * FROM tracks WHERE album_id = ? '\
+                'ORDER BY track_number, title, id'
+        self.cursor.execute(query, [album_id])
+        return 'tracks', self.cursor.fetchall()
+
+    def stats(self, *args):
+        """Show statistics about the music library index and searches
+
+        Usage: ml_stats [number]
+
+        Shows the size of the database, the number of items of each type, how
+        long the last indexing took, and the latency of the latest searches
+        along with the 'number' slowest of them (default 5). Searches that
+        were answered from the cache are not counted as slow.
+
+        Example:
+        ml_stats 10
+        """
+        try:
+            number = int(args[0]) if args else 5
+        except ValueError:
+            raise TypeError('Number must be parseable as integer')
+        for string in self._open_db():
+            yield string
+
+        # The size of the database files and of the unused pages, which can
+        # be reclaimed with VACUUM
+        dbpath = self._db_path('musiclib.db')
+        sizes = [os.path.getsize(path) if os.path.exists(path) else 0
+                 for path in [dbpath, dbpath + '-wal']]
+        self.cursor.execute('PRAGMA page_size')
+        page_size = self.cursor.fetchone()[0]
+        self.cursor.execute('PRAGMA freelist_count')
+        sizes.append(self.cursor.fetchone()[0] * page_size)
+        yield 'Database: {}'.format(dbpath)
+        yield 'Size:     {:.1f} MB, WAL {:.1f} MB, unused {:.1f} MB'.format(
+            *[size / 1024.0 ** 2 for size in sizes])
+
+        if self._is_indexed():
+            for string in self._index_stats():
+                yield string
+        else:
+            yield 'The music library has not been indexed. Run \'ml_index\''
+
+        for string in self._search_stats(number):
+            yield string
+
+    def _index_stats(self):
+        """Return the statistics of the last indexing as lines"""
+        yield 'Index:    version {}'.format(self._index_version())
+        query = 'SELECT name FROM sqlite_master WHERE type = "table"'
+        self.cursor.execute(query)
+        if ('index_stats',) not in self.cursor.fetchall():
+            return
+
+        self.cursor.execute('SELECT * FROM index_stats')
+        stats = self.cursor.fetchall()
+        if not stats:
+            return
+        pattern = '{: <10} {: >8} {: >8} {: >6} {: >8} {: >8}'
+        yield pattern.format('', 'rows', 'items', 'pages', 'seconds',
+                             'items/s')
+        for data_type, items, pages, seconds, _ in stats:
+            if data_type == 'all':
+                rows = sum(self._count_rows(table) for table in
+                           self.data_types)
+            else:
+                rows = self._count_rows(data_type)
+            yield pattern.format(data_type, rows, items, pages,
+                                 '{:.1f}'.format(seconds),
+                                 int(items / seconds) if seconds else '-')
+
+        query = 'SELECT indexed_at FROM index_stats WHERE data_type = "all"'
+        self.cursor.execute(query)
+        total = self.cursor.fetchone()
+        if total:
+            yield 'Indexed:  {}'.format(time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(total[0])))
+
+    def _count_rows(self, table):
+        """Return the number of rows in a table"""
+        self.cursor.execute('SELECT COUNT(*) FROM {}'.format(table))
+        return self.cursor.fetchone()[0]
+
+    def _search_stats(self, number):
+        """Return the statistics of the logged searches as lines"""
+        try:
+            connection = self._open_search_log()
+            searches = connection.execute(
+                'SELECT * FROM searches ORDER BY seconds DESC').fetchall()
+        except sqlite3.OperationalError as exception:
+            yield 'The search log could not be read: {}'.format(exception)
+            return
+        uncached = [search for search in searches if not search[-1]]
+        yield 'Searches: {} logged, {} answered from the cache'.format(
+            len(searches), len(searches) - len(uncached))
+        if not uncached:
+            return
+
+        # The searches are sorted slowest first
+        milliseconds = [search[5] * 1000 for search in reversed(uncached)]
+        yield 'Latency:  median {:.1f} ms, 90% {:.1f} ms, max {:.1f} ms'\
+            .format(self._percentile(milliseconds, 0.5),
+                    self._percentile(milliseconds, 0.9), milliseconds[-1])
+        yield 'Slowest searches:'
+        for when, data_type, field, search, results, seconds, _ in \
+                uncached[:number]:
+            yield '{: >8.1f} ms  ml_{} {}={}  {} results  {}'.format(
+                seconds * 1000, data_type, field, search, results,
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when)))
+
+    @staticmethod
+    def _percentile(values, fraction):
+        """Return the percentile of sorted values"""
+        return values[int(round((len(values) - 1) * fraction))]
+
     def _search(self, data_type, *args):
         """Perform the search"""
+        start = time.time()
         # Process search term
         search_string = args[0]
         if search_string.count('=') == 0:
@@ -270,55 +611,111 @@ class MusicLibrary(object):
 
         # Pad the search term with SQL LIKE wild cards
         search = search.join(['%', '%'])
-        # Do the search, if it has not been cached
-        if (data_type, field, search) in self.cached_searches:
-            results = self.cached_searches[(data_type, field, search)]
-        else:
-            if field in self._get_columns(data_type)[:-1]:
+        try:
+            search = search.decode('utf-8')
+        except AttributeError:
+            pass
+        # Do the search, if it has not been cached for this index version
+        cache_key = (self._index_version(), data_type, field, search)
+        with self._cache_lock:
+            results = self.cached_searches.get(cache_key)
+        cached = results is not None
+        if not cached:
+            if field in self.search_fields[data_type]:
                 # Perform the search in Sqlite3
                 query = 'SELECT * FROM {} WHERE {} LIKE ?'.format(data_type,
                                                                   field)
-                try:
-                    search = search.decode('utf-8')
-                except AttributeError:
-                    pass
                 self.cursor.execute(query, [search])
                 results = self.cursor.fetchall()
                 # Add results to the cache and reduce cache length if necesary
-                self.cached_searches[(data_type, field, search)] = results
-                while len(self.cached_searches) > self.cache_length:
-                    self.cached_searches.popitem(last=False)
+                with self._cache_lock:
+                    self.cached_searches[cache_key] = results
+                    while len(self.cached_searches) > self.cache_length:
+                        self.cached_searches.popitem(last=False)
             else:
                 message = 'The search field \'{}\' is unknown. Only {} is '\
-                    'allowed'.format(field, self._get_columns(data_type)[:-1])
+                    'allowed'.format(field, self.search_fields[data_type])
                 raise TypeError(message)
+        self._log_search(data_type, field, search[1:-1], len(results),
+                         time.time() - start, cached)
         return results
 
+    def _open_search_log(self):
+        """Open a connection to the search log database for this thread
+
+        The log is kept in its own database file, so that searches can use
+        read-only connections to the music library and are never held up by
+        an ongoing indexing.
+        """
+        connection = getattr(self._local, 'log_connection', None)
+        if not connection:
+            # Logging is skipped rather than waited for, see _log_search
+            connection = sqlite3.connect(self._db_path('search_log.db'),
+                                         timeout=0.1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS searches (time real, '
+                'data_type text, field text, search text, results integer, '
+                'seconds real, cached integer)')
+            self._local.log_connection = connection
+        return connection
+
+    def _log_search(self, data_type, field, search, results, seconds,
+                    cached):
+        """Add a search to the search log, which keeps the latest
+        self.search_log_length searches
+        """
+        try:
+            connection = self._open_search_log()
+            connection.execute(
+                'INSERT INTO searches VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [time.time(), data_type, field, search, results, seconds,
+                 int(cached)])
+            connection.execute(
+                'DELETE FROM searches WHERE rowid <= '
+                '(SELECT MAX(rowid) FROM searches) - ?',
+                [self.search_log_length])
+        except sqlite3.OperationalError:
+            # The statistics are not worth failing or delaying a search for
+            pass
+
     @staticmethod
-    def _play(sonos, data_type, results, *args):
-        """Play music library item from search"""
-        action, number = args[1:]
-        # Check action
-        if action not in ['add', 'replace']:
-            message = 'Action must be \'add\' or \'replace\''
-            raise TypeError(message)
+    def _get_number(results, number, name):
+        """Convert an item number, as printed for the results, to an index
+        into the results
 
-        # Convert and check number
+        name is used in the error messages, e.g. 'Play number must ...'
+        """
         try:
             number = int(number) - 1
         except ValueError:
-            raise TypeError('Play number must be parseable as integer')
+            raise TypeError('{} number must be parseable as integer'.format(
+                name))
         if number not in range(len(results)):
             if len(results) == 0:
-                message = 'No results to play from'
+                message = 'No results to choose from'
             elif len(results) == 1:
-                message = 'Play number can only be 1'
+                message = '{} number can only be 1'.format(name)
             else:
-                message = 'Play number has to be in the range from 1 to {}'.\
-                          format(len(results))
+                message = '{} number has to be in the range from 1 to {}'.\
+                          format(name, len(results))
+            raise TypeError(message)
+        return number
+
+    def _play(self, sonos, data_type, results, action, number):
+        """Play music library item from search"""
+        # Check action
+        if action not in ['add', 'replace']:
+            message = 'Action must be \'add\' or \'replace\''
             raise TypeError(message)
 
+        # Convert and check number
+        number = self._get_number(results, number, 'Play')
+
         # The last item in the search is the content dict in json
+        # pylint: disable=import-error
+        from soco.data_structures import MLTrack, MLAlbum, MLArtist, \
+            MLPlaylist
         item_dict = json.loads(results[number][-1])
         ml_classes = {'tracks': MLTrack, 'albums': MLAlbum,
                       'artists': MLArtist, 'playlists': MLPlaylist}
@@ -360,8 +757,100 @@ class MusicLibrary(object):
             yield number + print_patterns[data_type].format(**item_dict)
 
 
+class Job(object):
+    """A command running in the background of the interactive shell
+
+    The command is run in a daemon thread, so that the prompt stays
+    responsive. Cancelling a job is cooperative: the output of the command is
+    checked for cancellation between lines, so commands that yield their
+    output line by line (e.g. ml_index) stop at the next line, while a single
+    blocking call to the speaker is allowed to finish and its output is
+    discarded.
+
+    Errors printed with err() while the job runs are prefixed with the job
+    number and mark the job as failed.
+    """
+
+    def __init__(self, number, args):
+        self.number = number
+        self.command = ' '.join(args)
+        self.status = 'Running'
+        # Number of errors printed by the command
+        self.errors = 0
+        self._cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(args,))
+        self.thread.daemon = True
+
+    def start(self):
+        """Start running the command in the background"""
+        self.thread.start()
+
+    def cancel(self):
+        """Request the command to stop"""
+        self._cancel_event.set()
+        self.status = 'Cancelled'
+
+    @property
+    def cancelled(self):
+        """Return whether the job has been cancelled"""
+        return self._cancel_event.is_set()
+
+    @property
+    def running(self):
+        """Return whether the command is still running"""
+        return self.thread.is_alive()
+
+    def _run(self, args):
+        """Run the command and record how it ended"""
+        # Let err() know which job it prints for, see err
+        CURRENT.job = self
+        # pylint: disable=broad-except
+        try:
+            succeeded = process_cmd(args, job=self)
+        except SystemExit:
+            # sys.exit would only end this thread, not the shell
+            err('Exit only works in the foreground')
+            succeeded = False
+        except Exception as ex:
+            err(ex)
+            succeeded = False
+        if not succeeded or self.errors:
+            self.status = 'Failed'
+        elif not self.cancelled:
+            self.status = 'Done'
+        print('[{}] {: <10} {}'.format(self.number, self.status,
+                                       self.command))
+
+
+class LazySpeaker(object):
+    """Stand-in for a SoCo instance, that is only created when it is used
+
+    The music library commands only need a speaker to add items to the queue,
+    so searching works without a speaker and without contacting one.
+    """
+
+    def __init__(self, cmd, speaker_spec=None):
+        self._cmd = cmd
+        self._speaker_spec = speaker_spec
+        self._sonos = None
+
+    def __getattr__(self, name):
+        if self._sonos is None:
+            if self._speaker_spec is None:
+                message = 'Please specify a speaker IP for "{cmd}".'.format(
+                    cmd=self._cmd)
+                raise TypeError(message)
+            import soco
+            self._sonos = soco.SoCo(self._speaker_spec)
+        return getattr(self._sonos, name)
+
+
 # current speaker (used only in interactive mode)
 CUR_SPEAKER = None
+# per thread state, 'job' is the background job run by the thread, if any
+CURRENT = threading.local()
+# background jobs of the interactive shell, indexed by job number
+JOBS = OrderedDict()
 # Instance of music library class
 MUSIC_LIB = MusicLibrary()
 
@@ -378,8 +867,15 @@ def main():
         shell()
 
 
-def process_cmd(args):
-    """ Processes a single command """
+def process_cmd(args, job=None):
+    """ Processes a single command
+
+    If job is given, the command is run as that background job: output lines
+    are prefixed with the job number and the output stops if the job is
+    cancelled
+
+    Returns True if the command succeeded and False if an error was printed
+    """
 
     cmd = args.pop(0).lower()
 
@@ -394,7 +890,10 @@ def process_cmd(args):
         result = _call_func(func, args)
     except TypeError as ex:
         err(ex)
-        return
+        return False
+
+    if job is not None:
+        return _print_job_output(job, result)
 
     # colorama.init() takes over stdout/stderr to give cross-platform colors
     if colorama:
@@ -410,7 +909,7 @@ def process_cmd(args):
                 print(line)
         except TypeError as ex:
             err(ex)
-            return
+            return False
 
     else:
         print(result)
@@ -418,6 +917,33 @@ def process_cmd(args):
     # Release stdout/stderr from colorama
     if colorama:
         colorama.deinit()
+    return True
+
+
+def _print_job_output(job, result):
+    """ prints the output of a background job until it is cancelled and
+    returns False if an error was printed """
+    prefix = '[{}]'.format(job.number)
+    succeeded = True
+    if job.cancelled or result is None:
+        pass
+
+    elif hasattr(result, '__iter__'):
+        try:
+            for line in result:
+                if job.cancelled:
+                    break
+                print(prefix, line)
+        except TypeError as ex:
+            err(ex)
+            succeeded = False
+        # Close generators right away, so that they clean up in this thread
+        if hasattr(result, 'close'):
+            result.close()
+
+    else:
+        print(prefix, result)
+    return succeeded
 
 
 def _call_func(func, args):
@@ -441,11 +967,21 @@ def _check_args(cmd, args):
     if not req_ip:
         return func, args
 
+    if req_ip == LAZY_IP:
+        if CUR_SPEAKER:
+            args.insert(0, CUR_SPEAKER)
+        elif _has_speaker_spec(cmd, args):
+            args.insert(0, LazySpeaker(cmd, args.pop(0)))
+        else:
+            args.insert(0, LazySpeaker(cmd))
+        return func, args
+
     if not CUR_SPEAKER:
         if not args:
             err('Please specify a speaker IP for "{cmd}".'.format(cmd=cmd))
             return None, None
         else:
+            import soco
             speaker_spec = args.pop(0)
             sonos = soco.SoCo(speaker_spec)
             args.insert(0, sonos)
@@ -455,6 +991,24 @@ def _check_args(cmd, args):
     return func, args
 
 
+def _has_speaker_spec(cmd, args):
+    """ checks if the first argument of a lazy IP command is the speaker
+
+    The music library searches take 'text [action number]', so with 2 or 4
+    arguments the first one is the speaker. ml_browse takes numbers and an
+    action, so anything else as the first argument is the speaker.
+    """
+    if cmd == 'ml_browse':
+        if not args or args[0] in ['add', 'replace']:
+            return False
+        try:
+            int(args[0])
+        except ValueError:
+            return True
+        return False
+    return len(args) in [2, 4]
+
+
 def shell():
     """ Start an interactive shell """
 
@@ -481,6 +1035,13 @@ def shell():
             continue
 
         line = line.strip()
+
+        # A trailing & runs the command in the background. It is checked on
+        # the raw line, so that a quoted or escaped & is part of an argument.
+        background = line.endswith('&') and not line.endswith('\\&')
+        if background:
+            line = line[:-1].strip()
+
         if not line:
             continue
 
@@ -490,6 +1051,10 @@ def shell():
             err('Syntax error: %(error)s' % {'error': value_error})
             continue
 
+        if background:
+            start_job(args)
+            continue
+
         try:
             process_cmd(args)
         except KeyboardInterrupt:
@@ -589,7 +1154,15 @@ def get_queue(sonos):
 
 
 def err(message):
-    """ print an error message """
+    """ print an error message
+
+    In a background job the message is prefixed with the job number and the
+    job is marked as failed
+    """
+    job = getattr(CURRENT, 'job', None)
+    if job is not None:
+        job.errors += 1
+        message = '[{}] {}'.format(job.number, message)
     print(message, file=sys.stderr)
 
 
@@ -612,6 +1185,7 @@ def play_index(sonos, index):
 
 def list_ips():
     """ List available devices """
+    import soco
     sonos = soco.SonosDiscovery()
     return sonos.get_speaker_ips()
 
@@ -663,11 +1237,54 @@ def state(sonos):
     return sonos.get_current_transport_info()['current_transport_state']
 
 
+def start_job(args):
+    """ start a command as a background job of the shell """
+    number = max(JOBS.keys() or [0]) + 1
+    job = Job(number, args)
+    JOBS[number] = job
+    print('[{}] {}'.format(number, job.command))
+    job.start()
+
+
+def list_jobs():
+    """ List the background jobs of the shell
+
+    Usage: jobs
+
+    Start a command in the background by ending it with '&', e.g:
+    ml_index 192.168.0.10 &
+
+    Finished jobs are listed once and then forgotten.
+    """
+    for number, job in list(JOBS.items()):
+        yield '[{}] {: <10} {}'.format(number, job.status, job.command)
+        if not job.running:
+            del JOBS[number]
+
+
+def cancel_job(number):
+    """ Cancel a background job
+
+    Usage: cancel number
+
+    'number' is the job number as shown by 'jobs'.
+    """
+    try:
+        job = JOBS[int(number)]
+    except (ValueError, KeyError):
+        raise TypeError('No job with number {}. See \'jobs\''.format(number))
+    if not job.running:
+        return 'Job {} is not running'.format(job.number)
+    job.cancel()
+    return 'Cancelling job {}: {}'.format(job.number, job.command)
+
+
 def set_speaker(ip_address):
     """ set the current speaker for the shell session """
     # pylint: disable=global-statement,fixme
     # TODO: this should be refactored into a class with instance-wide state
     global CUR_SPEAKER
+    import soco
     CUR_SPEAKER = soco.SoCo(ip_address)
 
 
@@ -684,6 +1301,7 @@ def get_help(command=None):
         """ Format command name and first line of docstring """
         name, func = item[0], item[1][1]
         if isinstance(func, str):
+            import soco
             func = getattr(soco.SoCo, func)
         doc = getattr(func, '__doc__') or ''
         doc = doc.split('\n')[0].lstrip()
@@ -702,10 +1320,17 @@ def get_help(command=None):
     return out
 
 
+# The speaker IP is optional for commands that only need a speaker for some
+# of their actions. If the first argument is a speaker, see
+# _has_speaker_spec, it is used to create the speaker when it is first needed.
+LAZY_IP = 'lazy'
+
 # COMMANDS indexes commands by their name. Each command is a 2-tuple of
 # (requires_ip, function) where function is either a callable, or a
 # method name to be called on a SoCo instance (depending on requires_ip)
-# If requires_ip is False, function must be a callable.
+# If requires_ip is False, function must be a callable. If requires_ip is
+# LAZY_IP, function must be a callable and gets a LazySpeaker if no current
+# speaker is set.
 COMMANDS = OrderedDict((
     #  cmd         req IP  func
     # pylint: disable=bad-whitespace
@@ -722,10 +1347,14 @@ COMMANDS = OrderedDict((
     ('volume',       (True, volume)),
     ('state',        (True, state)),
     ('ml_index',     (True, MUSIC_LIB.index)),
-    ('ml_tracks',    (True, MUSIC_LIB.tracks)),
-    ('ml_albums',    (True, MUSIC_LIB.albums)),
-    ('ml_artists',   (True, MUSIC_LIB.artists)),
-    ('ml_playlists', (True, MUSIC_LIB.playlists)),
+    ('ml_tracks',    (LAZY_IP, MUSIC_LIB.tracks)),
+    ('ml_albums',    (LAZY_IP, MUSIC_LIB.albums)),
+    ('ml_artists',   (LAZY_IP, MUSIC_LIB.artists)),
+    ('ml_playlists', (LAZY_IP, MUSIC_LIB.playlists)),
+    ('ml_browse',    (LAZY_IP, MUSIC_LIB.browse)),
+    ('ml_stats',     (False, MUSIC_LIB.stats)),
+    ('jobs',         (False, list_jobs)),
+    ('cancel',       (False, cancel_job)),
     ('exit',         (False, exit_shell)),
     ('set',          (False, set_speaker)),
     ('unset',        (False, unset_speaker)),